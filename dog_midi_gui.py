@@ -4,21 +4,29 @@ Provides visual feedback and control interface
 """
 
 import streamlit as st
-import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 import plotly.express as px
 import numpy as np
 import threading
 import time
 from dog_midi_system import DogMidiSystem
-import pandas as pd
-from collections import deque
 import os
 
+@st.cache_data(ttl=5)
+def list_midi_files(dir_mtime: float):
+    """List MIDI files in the current directory (cached until its mtime changes)"""
+    return [f for f in os.listdir('.') if f.endswith('.mid') or f.endswith('.midi')]
+
 class DogMidiGUI:
     def __init__(self):
         self.system = None
-        self.note_history = deque(maxlen=50)
+        
+        # Note history ring buffer: preallocated columns plus a write cursor
+        self.history_size = 50
+        self._hist_t = np.empty(self.history_size, dtype=np.float64)
+        self._hist_n = np.empty(self.history_size, dtype=np.int16)
+        self._hist_v = np.empty(self.history_size, dtype=np.int16)
+        self._hist_i = 0
         self.is_running = False
         
     def setup_page(self):
@@ -38,7 +46,7 @@ class DogMidiGUI:
         st.sidebar.header("🎛️ Controls")
         
         # MIDI file selection
-        midi_files = [f for f in os.listdir('.') if f.endswith('.mid') or f.endswith('.midi')]
+        midi_files = list_midi_files(os.stat('.').st_mtime)
         if not midi_files:
             st.sidebar.warning("No MIDI files found in current directory")
             midi_file = st.sidebar.text_input("MIDI File Path", "totoro_theme.mid")
@@ -104,6 +112,7 @@ class DogMidiGUI:
             self.is_running = False
             st.sidebar.info("System stopped")
     
+    @st.fragment(run_every=1.0)
     def display_current_status(self):
         """Display current system status"""
         col1, col2, col3, col4 = st.columns(4)
@@ -121,7 +130,7 @@ class DogMidiGUI:
                 st.metric("Tempo", f"{self.system.tempo} BPM")
             
             with col4:
-                st.metric("Notes Played", len(self.note_history))
+                st.metric("Notes Played", self.history_length())
         else:
             with col1:
                 st.metric("Current Bar", "—")
@@ -132,64 +141,78 @@ class DogMidiGUI:
             with col4:
                 st.metric("Notes Played", "—")
     
+    @st.fragment(run_every=1.0)
     def display_note_visualization(self):
         """Display note visualization"""
         st.subheader("🎼 Note Activity")
         
-        if len(self.note_history) > 0:
-            # Create a simple note history chart
-            notes_df = pd.DataFrame(list(self.note_history))
-            
-            fig = px.scatter(
-                notes_df, 
-                x='time', 
-                y='note',
-                color='velocity',
-                size='velocity',
-                title="Recent Note Activity",
-                labels={'time': 'Time', 'note': 'MIDI Note', 'velocity': 'Velocity'}
+        if self.history_length() > 0:
+            # Reuse one WebGL figure across reruns and only swap its point data
+            fig = self.note_activity_figure()
+            times, notes, velocities = self.recent_notes()
+            fig.data[0].update(
+                x=times,
+                y=notes,
+                marker=dict(color=velocities, size=velocities)
             )
             
-            fig.update_layout(
-                height=400,
-                showlegend=True
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig, use_container_width=True, key="note_activity")
         else:
             st.info("🎹 Start playing to see note visualization!")
     
+    def note_activity_figure(self):
+        """Get the note activity figure cached in the session state"""
+        if 'note_activity_fig' not in st.session_state:
+            fig = go.Figure(go.Scattergl(
+                x=[],
+                y=[],
+                mode='markers',
+                marker=dict(
+                    colorscale='Plasma',
+                    cmin=0,
+                    cmax=127,
+                    sizemode='area',
+                    sizeref=2.0 * 127 / 20 ** 2,
+                    colorbar=dict(title='Velocity')
+                )
+            ))
+            fig.update_layout(
+                title="Recent Note Activity",
+                xaxis_title='Time',
+                yaxis_title='MIDI Note',
+                height=400
+            )
+            st.session_state['note_activity_fig'] = fig
+        return st.session_state['note_activity_fig']
+    
     def display_original_melody(self):
         """Display the original melody structure"""
         st.subheader("🎵 Original Melody Structure")
         
-        if self.system and self.system.original_notes:
-            # Create a piano roll visualization
-            notes_data = []
-            for note in self.system.original_notes[:100]:  # Limit to first 100 notes
-                notes_data.append({
-                    'start_time': note.start_time,
-                    'note': note.note,
-                    'duration': note.duration,
-                    'velocity': note.velocity,
-                    'bar': note.bar
-                })
+        if self.system and self.system.note_count:
+            # Create a piano roll visualization (WebGL, so the whole melody fits)
+            system = self.system
+            notes_data = {
+                'start_time': system.notes_start,
+                'note': system.notes_pitch,
+                'duration': system.notes_duration,
+                'velocity': system.notes_velocity,
+                'bar': system.notes_bar
+            }
             
-            if notes_data:
-                df = pd.DataFrame(notes_data)
-                
-                fig = px.scatter(
-                    df,
-                    x='start_time',
-                    y='note',
-                    color='bar',
-                    size='velocity',
-                    title="Original Melody (Piano Roll View)",
-                    labels={'start_time': 'Time (seconds)', 'note': 'MIDI Note', 'bar': 'Bar'}
-                )
-                
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
+            fig = px.scatter(
+                notes_data,
+                x='start_time',
+                y='note',
+                color='bar',
+                size='velocity',
+                render_mode='webgl',
+                title="Original Melody (Piano Roll View)",
+                labels={'start_time': 'Time (seconds)', 'note': 'MIDI Note', 'bar': 'Bar'}
+            )
+            
+            fig.update_layout(height=400)
+            st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("Load a MIDI file to see the original melody structure")
     
@@ -223,11 +246,25 @@ class DogMidiGUI:
     
     def add_note_to_history(self, note, velocity):
         """Add a note to the visualization history"""
-        self.note_history.append({
-            'time': time.time(),
-            'note': note,
-            'velocity': velocity
-        })
+        i = self._hist_i % self.history_size
+        self._hist_t[i] = time.monotonic_ns() * 1e-9
+        self._hist_n[i] = note
+        self._hist_v[i] = velocity
+        self._hist_i += 1
+    
+    def history_length(self):
+        """Number of notes currently held in the history"""
+        return min(self._hist_i, self.history_size)
+    
+    def recent_notes(self):
+        """Return (times, notes, velocities) from the history, oldest first"""
+        if self._hist_i <= self.history_size:
+            window = slice(0, self._hist_i)
+        else:
+            # Buffer has wrapped: the oldest entry sits at the write cursor
+            cursor = self._hist_i % self.history_size
+            window = np.r_[cursor:self.history_size, 0:cursor]
+        return self._hist_t[window], self._hist_n[window], self._hist_v[window]
     
     def run(self):
         """Run the Streamlit GUI"""
@@ -250,10 +287,6 @@ class DogMidiGUI:
         
         with tab3:
             self.display_instructions()
-        
-        # Auto-refresh every second
-        time.sleep(1)
-        st.rerun()
 
 def main():
     """Main function to run the GUI"""
@@ -8,16 +8,177 @@ import pretty_midi
 import pygame.midi
 import numpy as np
 import threading
+import heapq
 import time
-import random
 from collections import deque
-from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import List, NamedTuple, Optional, Tuple
 import json
+import os
+import glob
+import multiprocessing
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 
-@dataclass
-class NoteEvent:
-    """Represents a MIDI note event with timing information"""
+try:
+    from symusic import Score
+except ImportError:
+    Score = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+_NO_NOTES = np.empty(0, dtype=np.intp)
+_NEARBY_BARS = np.array([-1, 0, 1])
+_POS_SLACK = 1e-3  # beats; widens lookup windows past float32 rounding of note beats
+
+def _score_candidates_numpy(idx, pitch, bar, beat, input_note, current_bar, current_beat,
+                            pitch_range, beat_tol):
+    """Return the best-scoring melody index among idx, or -1 if none qualifies"""
+    # Only the current and adjacent bars count, and pitch and timing differences
+    # must stay within the correction limits
+    pitch_diff = np.abs(pitch[idx] - input_note)
+    beat_diff = np.abs(beat[idx] - current_beat)
+    mask = np.abs(bar[idx] - current_bar) <= 1
+    mask &= (pitch_diff <= pitch_range) & (beat_diff <= beat_tol)
+    if not mask.any():
+        return -1
+    
+    # Combined score (lower is better)
+    scores = np.where(mask, pitch_diff * 0.7 + beat_diff * 0.3, np.inf)
+    return int(idx[scores.argmin()])
+
+def _score_candidates_loop(idx, pitch, bar, beat, input_note, current_bar, current_beat,
+                           pitch_range, beat_tol):
+    """Single-pass version of _score_candidates_numpy for Numba (no temporaries)"""
+    best_i = -1
+    best_score = 1e18
+    for j in range(idx.shape[0]):
+        i = idx[j]
+        if abs(bar[i] - current_bar) > 1:
+            continue
+        pitch_diff = abs(pitch[i] - input_note)
+        if pitch_diff > pitch_range:
+            continue
+        beat_diff = abs(beat[i] - current_beat)
+        if beat_diff > beat_tol:
+            continue
+        score = pitch_diff * 0.7 + beat_diff * 0.3
+        if score < best_score:
+            best_score = score
+            best_i = i
+    return best_i
+
+if njit is not None:
+    _score_candidates = njit(cache=True, fastmath=True)(_score_candidates_loop)
+else:
+    _score_candidates = _score_candidates_numpy
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "dogmidi")
+CACHE_VERSION = 2  # bump whenever the parsed column layout changes
+
+def parse_midi_file(path: str):
+    """Parse a MIDI file into (tempo, pitch, velocity, start, duration) columns"""
+    cache_path = _cache_path(path)
+    cached = _read_cache(cache_path)
+    if cached is not None:
+        return cached
+    
+    if Score is not None:
+        parsed = _parse_with_symusic(path)
+    else:
+        parsed = _parse_with_pretty_midi(path)
+    _write_cache(cache_path, parsed)
+    return parsed
+
+def _cache_path(path: str) -> str:
+    """Cache file for a MIDI file, keyed by its absolute path, mtime, size and cache format"""
+    stat = os.stat(path)
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(
+        CACHE_DIR, f"{digest}.v{CACHE_VERSION}.{stat.st_mtime_ns}.{stat.st_size}.npz"
+    )
+
+def _read_cache(cache_path: str):
+    """Load parsed columns from the cache, or None if missing or unreadable"""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with np.load(cache_path) as cached:
+            tempo = cached['tempo']
+            return (float(tempo[0]) if tempo.size else None, cached['pitch'],
+                    cached['velocity'], cached['start'], cached['duration'])
+    except Exception as e:
+        # Treat a damaged entry as a miss and drop it so the file gets re-parsed
+        print(f"Ignoring unreadable MIDI cache entry {cache_path}: {e}")
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
+        return None
+
+def _write_cache(cache_path: str, parsed):
+    """Save parsed columns to the cache, replacing entries for older versions of the file"""
+    tempo, pitch, velocity, start, duration = parsed
+    # Write to a temporary file first so readers never see a partial cache
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, tempo=np.array([] if tempo is None else [tempo]), pitch=pitch,
+                     velocity=velocity, start=start, duration=duration)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"Could not cache parsed MIDI file: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+    
+    # Only drop older entries once the new one is safely in place
+    digest = os.path.basename(cache_path).split('.')[0]
+    for stale in glob.glob(os.path.join(CACHE_DIR, f"{digest}.*.npz")):
+        if stale != cache_path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+def _parse_with_symusic(path: str):
+    """Parse a MIDI file with symusic (C++ backend)"""
+    # Converting to seconds lets symusic apply the whole tempo map for us
+    score = Score(path).to("second")
+    tempo = score.tempos[0].qpm if len(score.tempos) else None
+    
+    tracks = [track.notes.numpy() for track in score.tracks if not track.is_drum]
+    columns = [np.concatenate([t[key] for t in tracks]) if tracks else np.empty(0)
+               for key in ('pitch', 'velocity', 'time', 'duration')]
+    return (tempo, *columns)
+
+_PRETTY_MIDI_NOTE = np.dtype([
+    ('pitch', np.int16), ('velocity', np.int16), ('start', np.float64), ('end', np.float64)
+])
+
+def _parse_with_pretty_midi(path: str):
+    """Parse a MIDI file with pretty_midi (fallback when symusic is missing)"""
+    midi_data = pretty_midi.PrettyMIDI(path)
+    
+    # Extract tempo
+    _, tempos = midi_data.get_tempo_changes()
+    tempo = float(tempos[0]) if len(tempos) else None
+    
+    # Materialize every melodic note in a single sweep into a structured array
+    notes = np.fromiter(
+        ((n.pitch, n.velocity, n.start, n.end) for instrument in midi_data.instruments
+         if not instrument.is_drum for n in instrument.notes),
+        dtype=_PRETTY_MIDI_NOTE
+    )
+    return tempo, notes['pitch'], notes['velocity'], notes['start'], notes['end'] - notes['start']
+
+class NoteEvent(NamedTuple):
+    """A single melody note with timing information, built on demand from the note arrays"""
     note: int
     velocity: int
     start_time: float
@@ -29,62 +190,88 @@ class DogMidiSystem:
     def __init__(self, midi_file_path: str):
         """Initialize the Dog MIDI System"""
         self.midi_file_path = midi_file_path
-        self.original_notes = []
+        self.preloaded = {}  # path -> parse_midi_file() result
+        
+        # Melody stored as parallel arrays (one entry per note, sorted by start time)
+        self.notes_pitch = np.empty(0, dtype=np.int16)
+        self.notes_velocity = np.empty(0, dtype=np.int16)
+        self.notes_start = np.empty(0, dtype=np.float64)
+        self.notes_duration = np.empty(0, dtype=np.float64)
+        self.notes_bar = np.empty(0, dtype=np.int16)
+        self.notes_beat = np.empty(0, dtype=np.float32)
+        self._note_pos = np.empty(0, dtype=np.float64)
+        self._pos_bar_len = 4.0
+        self._notes_lock = threading.RLock()
+        
         self.current_bar = 0
         self.current_beat = 0.0
-        self.tempo = 120  # BPM
         self.time_signature = (4, 4)  # 4/4 time
+        self._tempo = 120  # BPM
         self.is_playing = False
-        self.start_time = None
+        self._start_ns = None  # time.monotonic_ns() when playback started
         
         # MIDI setup
         pygame.midi.init()
         self.midi_input = None
         self.midi_output = None
         
+        # Pending note-offs as a (deadline_ns, note) heap, drained by one scheduler thread
+        self.note_length = 0.5  # seconds
+        self._noteoff_heap = []
+        self._noteoff_lock = threading.Lock()
+        self._noteoff_event = threading.Event()
+        self._scheduler_thread = None
+        
         # Correction parameters
-        self.timing_tolerance = 0.5  # seconds
+        self._timing_tolerance = 0.5  # seconds
         self.pitch_correction_range = 12  # semitones
         self.randomness_factor = 0.1  # 0-1, amount of randomness to add
+        self._update_timing()
+        self._rng = np.random.default_rng()
+        self._refill_random()
         
         # Load and analyze the original MIDI file
         self.load_midi_file()
         self.setup_midi_devices()
         
+    @property
+    def tempo(self) -> float:
+        """Tempo in BPM"""
+        return self._tempo
+    
+    @tempo.setter
+    def tempo(self, value: float):
+        self._tempo = value
+        self._update_timing()
+    
+    @property
+    def timing_tolerance(self) -> float:
+        """Timing tolerance in seconds"""
+        return self._timing_tolerance
+    
+    @timing_tolerance.setter
+    def timing_tolerance(self, value: float):
+        self._timing_tolerance = value
+        self._update_timing()
+    
+    def _update_timing(self):
+        """Cache the derived timing constants used on every input event"""
+        self._beat_duration = 60.0 / self._tempo
+        self._beats_per_bar = float(self.time_signature[0])
+        self._beat_tol = self._timing_tolerance * self._tempo / 60.0
+    
     def load_midi_file(self):
         """Load and analyze the original MIDI file"""
         try:
-            midi_data = pretty_midi.PrettyMIDI(self.midi_file_path)
-            
-            # Extract tempo and time signature
-            if midi_data.get_tempo_changes()[1]:
-                self.tempo = midi_data.get_tempo_changes()[1][0]
-            
-            # Extract notes from all instruments
-            for instrument in midi_data.instruments:
-                if not instrument.is_drum:
-                    for note in instrument.notes:
-                        # Calculate bar and beat position
-                        beat_duration = 60.0 / self.tempo
-                        beats_per_bar = self.time_signature[0]
-                        
-                        total_beats = note.start / beat_duration
-                        bar = int(total_beats // beats_per_bar)
-                        beat = total_beats % beats_per_bar
-                        
-                        note_event = NoteEvent(
-                            note=note.pitch,
-                            velocity=note.velocity,
-                            start_time=note.start,
-                            duration=note.end - note.start,
-                            bar=bar,
-                            beat=beat
-                        )
-                        self.original_notes.append(note_event)
+            parsed = self.preloaded.get(self.midi_file_path)
+            if parsed is None:
+                parsed = parse_midi_file(self.midi_file_path)
+            tempo, *columns = parsed
+            if tempo is not None:
+                self.tempo = tempo
             
-            # Sort notes by start time
-            self.original_notes.sort(key=lambda x: x.start_time)
-            print(f"Loaded {len(self.original_notes)} notes from MIDI file")
+            self._set_notes(*columns)
+            print(f"Loaded {self.note_count} notes from MIDI file")
             print(f"Tempo: {self.tempo} BPM")
             
         except Exception as e:
@@ -92,26 +279,108 @@ class DogMidiSystem:
             # Create a simple fallback melody (C major scale)
             self.create_fallback_melody()
     
+    def preload(self, paths: List[str]):
+        """Parse several MIDI files in parallel so they can be swapped in instantly"""
+        paths = [path for path in paths if path not in self.preloaded]
+        if not paths:
+            return
+        
+        # Forking a process that already runs MIDI, scheduler and Streamlit threads
+        # can deadlock, so start workers from a clean interpreter instead
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        max_workers = min(len(paths), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            futures = {path: executor.submit(parse_midi_file, path) for path in paths}
+            for path, future in futures.items():
+                try:
+                    self.preloaded[path] = future.result()
+                except Exception as e:
+                    print(f"Error preloading {path}: {e}")
+    
+    def select_midi_file(self, midi_file_path: str):
+        """Switch the reference melody to another MIDI file"""
+        self.midi_file_path = midi_file_path
+        self.load_midi_file()
+        
+        # Restart from the top of the new melody once its arrays are in place
+        with self._notes_lock:
+            self.melody_index = 0
+    
+    def _set_notes(self, pitch, velocity, start, duration, bar=None, beat=None):
+        """Store the melody as parallel arrays sorted by start time
+        
+        Bar and beat positions are derived from the start times unless given.
+        """
+        order = np.argsort(start, kind='stable')
+        start = np.asarray(start, dtype=np.float64)[order]
+        
+        if bar is None or beat is None:
+            # Calculate bar and beat positions
+            total_beats = start / self._beat_duration
+            bar = total_beats // self._beats_per_bar
+            beat = total_beats % self._beats_per_bar
+        else:
+            bar = np.asarray(bar)[order]
+            beat = np.asarray(beat)[order]
+        
+        # Swap the whole melody at once so input callbacks never see a mix of two songs
+        with self._notes_lock:
+            self.notes_pitch = np.asarray(pitch, dtype=np.int16)[order]
+            self.notes_velocity = np.asarray(velocity, dtype=np.int16)[order]
+            self.notes_start = start
+            self.notes_duration = np.asarray(duration, dtype=np.float64)[order]
+            self.notes_bar = np.asarray(bar).astype(np.int16)
+            self.notes_beat = np.asarray(beat).astype(np.float32)
+            self._index_notes()
+        
+        # Compile the scoring kernel now so the first key press isn't slow
+        _score_candidates(_NO_NOTES, self.notes_pitch, self.notes_bar, self.notes_beat,
+                          0, 0, 0.0, 0.0, 0.0)
+    
+    def _index_notes(self):
+        """Precompute each note's position in beats from the start of bar 0
+        
+        Notes are sorted by start time, so these positions are sorted too and the
+        notes near any (bar, beat) form a contiguous run found by binary search.
+        """
+        self._pos_bar_len = self._beats_per_bar
+        self._note_pos = self.notes_bar.astype(np.float64) * self._pos_bar_len + self.notes_beat
+    
+    @property
+    def note_count(self) -> int:
+        """Number of notes in the loaded melody"""
+        return len(self.notes_pitch)
+    
+    def note_event_view(self, i: int) -> NoteEvent:
+        """Build a NoteEvent for the i-th melody note"""
+        with self._notes_lock:
+            return NoteEvent(
+                note=int(self.notes_pitch[i]),
+                velocity=int(self.notes_velocity[i]),
+                start_time=float(self.notes_start[i]),
+                duration=float(self.notes_duration[i]),
+                bar=int(self.notes_bar[i]),
+                beat=float(self.notes_beat[i])
+            )
+    
     def create_fallback_melody(self):
         """Create a simple fallback melody if MIDI loading fails"""
         print("Creating fallback melody...")
         c_major_scale = [60, 62, 64, 65, 67, 69, 71, 72]  # C4 to C5
-        beat_duration = 60.0 / self.tempo
+        beat_duration = self._beat_duration
         
-        for i, note in enumerate(c_major_scale * 4):  # Repeat scale 4 times
-            start_time = i * beat_duration
-            bar = i // 8
-            beat = (i % 8) / 2.0
-            
-            note_event = NoteEvent(
-                note=note,
-                velocity=80,
-                start_time=start_time,
-                duration=beat_duration * 0.8,
-                bar=bar,
-                beat=beat
-            )
-            self.original_notes.append(note_event)
+        pitch = np.tile(c_major_scale, 4)  # Repeat scale 4 times
+        steps = np.arange(len(pitch))
+        self._set_notes(
+            pitch,
+            np.full(len(pitch), 80),
+            steps * beat_duration,
+            np.full(len(pitch), beat_duration * 0.8),
+            # The fallback scale uses eighth-note positions within each bar
+            bar=steps // 8,
+            beat=(steps % 8) / 2.0
+        )
     
     def setup_midi_devices(self):
         """Setup MIDI input and output devices"""
@@ -122,17 +391,12 @@ class DogMidiSystem:
                 info = pygame.midi.get_device_info(i)
                 print(f"  {i}: {info[1].decode()} ({'Input' if info[2] else 'Output'})")
             
-            # Find and setup input device
-            input_id = None
-            for i in range(pygame.midi.get_count()):
-                info = pygame.midi.get_device_info(i)
-                if info[2]:  # Is input device
-                    input_id = i
-                    break
-            
-            if input_id is not None:
-                self.midi_input = pygame.midi.Input(input_id)
-                print(f"Using MIDI input: {pygame.midi.get_device_info(input_id)[1].decode()}")
+            # Find and setup input device; mido delivers events through a callback
+            # so no thread has to poll the port
+            input_names = mido.get_input_names()
+            if input_names:
+                self.midi_input = mido.open_input(input_names[0], callback=self._on_mido_msg)
+                print(f"Using MIDI input: {input_names[0]}")
             else:
                 print("No MIDI input device found")
             
@@ -155,81 +419,90 @@ class DogMidiSystem:
     
     def get_current_position(self) -> Tuple[int, float]:
         """Get current bar and beat position"""
-        if not self.start_time:
+        if self._start_ns is None:
             return 0, 0.0
         
-        elapsed_time = time.time() - self.start_time
-        beat_duration = 60.0 / self.tempo
-        beats_per_bar = self.time_signature[0]
-        
-        total_beats = elapsed_time / beat_duration
-        bar = int(total_beats // beats_per_bar)
-        beat = total_beats % beats_per_bar
+        elapsed_time = (time.monotonic_ns() - self._start_ns) * 1e-9
+        total_beats = elapsed_time / self._beat_duration
+        bar = int(total_beats // self._beats_per_bar)
+        beat = total_beats % self._beats_per_bar
         
         return bar, beat
     
     def find_closest_note(self, input_note: int, current_bar: int, current_beat: float) -> Optional[NoteEvent]:
         """Find the closest matching note from the original melody"""
-        # Get notes from current and nearby bars
-        candidate_notes = []
-        for note_event in self.original_notes:
-            bar_diff = abs(note_event.bar - current_bar)
-            if bar_diff <= 1:  # Look at current bar and adjacent bars
-                candidate_notes.append(note_event)
-        
-        if not candidate_notes:
-            return None
-        
-        # Find the best match based on pitch and timing
-        best_note = None
-        best_score = float('inf')
-        
-        for note_event in candidate_notes:
-            # Calculate pitch difference
-            pitch_diff = abs(note_event.note - input_note)
-            if pitch_diff > self.pitch_correction_range:
-                continue
+        with self._notes_lock:
+            if not self.note_count:
+                return None
             
-            # Calculate timing difference
-            beat_diff = abs(note_event.beat - current_beat)
-            if beat_diff > self.timing_tolerance * self.tempo / 60:
-                continue
+            # A note can only match if it lies within the timing tolerance of
+            # current_beat in the current or an adjacent bar; each of those three
+            # windows is a contiguous run of the sorted note positions
+            window = self._beat_tol + _POS_SLACK
+            centers = (current_bar + _NEARBY_BARS) * self._pos_bar_len + current_beat
+            lo = np.searchsorted(self._note_pos, centers - window, side='left')
+            hi = np.searchsorted(self._note_pos, centers + window, side='right')
+            idx = np.r_[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+            if not len(idx):
+                return None
             
-            # Combined score (lower is better)
-            score = pitch_diff * 0.7 + beat_diff * 0.3
+            # The kernel applies the exact bar, pitch and timing limits
+            best = _score_candidates(idx, self.notes_pitch, self.notes_bar, self.notes_beat,
+                                     int(input_note), int(current_bar), float(current_beat),
+                                     float(self.pitch_correction_range), self._beat_tol)
+            if best < 0:
+                return None
             
-            if score < best_score:
-                best_score = score
-                best_note = note_event
-        
-        return best_note
+            return self.note_event_view(best)
     
     def apply_randomness(self, note: int, velocity: int) -> Tuple[int, int]:
         """Apply controlled randomness to make it sound less robotic"""
-        if random.random() < self.randomness_factor:
+        randomness_factor = self.randomness_factor
+        if randomness_factor == 0.0:
+            return note, velocity
+        
+        # Draw from a pre-generated batch instead of calling the RNG per note
+        if self._rand_i >= len(self._rand_gate):
+            self._refill_random()
+        i = self._rand_i
+        self._rand_i += 1
+        
+        if self._rand_gate[i] < randomness_factor:
+            note_variation, velocity_variation = self._rand_offsets[i].tolist()
+            
             # Small pitch variation
-            note_variation = random.randint(-2, 2)
             note = max(0, min(127, note + note_variation))
             
             # Small velocity variation
-            velocity_variation = random.randint(-10, 10)
             velocity = max(1, min(127, velocity + velocity_variation))
         
         return note, velocity
     
+    def _refill_random(self, size: int = 1024):
+        """Generate the next batch of randomness draws"""
+        self._rand_gate = self._rng.random(size)
+        self._rand_offsets = np.column_stack([
+            self._rng.integers(-2, 3, size=size),
+            self._rng.integers(-10, 11, size=size)
+        ]).astype(np.int8)
+        self._rand_i = 0
+    
     def process_input_note(self, input_note: int, velocity: int):
         """
         Strict melody-following: Any input triggers the next note in the original melody sequence.
         """
         if not hasattr(self, 'melody_index'):
             self.melody_index = 0
-        if not self.original_notes:
-            print("No original melody loaded.")
-            return
+        with self._notes_lock:
+            if not self.note_count:
+                print("No original melody loaded.")
+                return
 
-        # Get the next note in the melody
-        note_event = self.original_notes[self.melody_index]
-        self.melody_index = (self.melody_index + 1) % len(self.original_notes)
+            # Get the next note in the melody (the melody may have been swapped
+            # for a shorter one since the index was last advanced)
+            index = self.melody_index % self.note_count
+            note_event = self.note_event_view(index)
+            self.melody_index = (index + 1) % self.note_count
 
         corrected_note = note_event.note
         corrected_velocity = note_event.velocity
@@ -240,29 +513,50 @@ class DogMidiSystem:
         # Send only the strict melody note to output
         if self.midi_output:
             self.midi_output.note_on(corrected_note, corrected_velocity)
-            threading.Timer(0.5, lambda: self.midi_output.note_off(corrected_note, 0)).start()
+            self.schedule_note_off(corrected_note, self.note_length)
 
-        print(f"Melody Step: {self.melody_index}/{len(self.original_notes)} -> Output: {corrected_note}")
+        print(f"Melody Step: {self.melody_index}/{self.note_count} -> Output: {corrected_note}")
 
     
-    def listen_for_input(self):
-        """Listen for MIDI input in a separate thread"""
-        print("Listening for MIDI input... Press Ctrl+C to stop")
-        
+    def schedule_note_off(self, note: int, delay: float):
+        """Queue a note-off to be sent after delay seconds"""
+        with self._noteoff_lock:
+            heapq.heappush(self._noteoff_heap, (time.monotonic_ns() + int(delay * 1e9), note))
+        self._noteoff_event.set()
+    
+    def _pop_due_note_offs(self, now_ns: float) -> List[int]:
+        """Remove and return all notes whose note-off deadline has passed"""
+        due = []
+        with self._noteoff_lock:
+            while self._noteoff_heap and self._noteoff_heap[0][0] <= now_ns:
+                due.append(heapq.heappop(self._noteoff_heap)[1])
+        return due
+    
+    def _note_off_scheduler(self):
+        """Send scheduled note-offs until the system stops"""
         while self.is_playing:
-            if self.midi_input and self.midi_input.poll():
-                midi_events = self.midi_input.read(10)
-                
-                for event in midi_events:
-                    status = event[0][0]
-                    note = event[0][1]
-                    velocity = event[0][2]
-                    
-                    # Note on event
-                    if 144 <= status <= 159 and velocity > 0:
-                        self.process_input_note(note, velocity)
+            self._noteoff_event.clear()
+            with self._noteoff_lock:
+                timeout = ((self._noteoff_heap[0][0] - time.monotonic_ns()) * 1e-9
+                           if self._noteoff_heap else None)
+            self._noteoff_event.wait(timeout)
             
-            time.sleep(0.01)  # Small delay to prevent CPU overload
+            self._send_note_offs(self._pop_due_note_offs(time.monotonic_ns()))
+    
+    def _send_note_offs(self, notes: List[int]):
+        """Send note-offs as batched writes rather than one call per note"""
+        # pygame.midi accepts at most 1024 events per write
+        for i in range(0, len(notes), 1024):
+            self.midi_output.write([[[0x80, note, 0], 0] for note in notes[i:i + 1024]])
+    
+    def _on_mido_msg(self, msg):
+        """Handle a MIDI message delivered by the mido input callback"""
+        if not self.is_playing:
+            return
+        
+        # Note on event
+        if msg.type == 'note_on' and msg.velocity > 0:
+            self.process_input_note(msg.note, msg.velocity)
     
     def start(self):
         """Start the dog MIDI system"""
@@ -271,15 +565,16 @@ class DogMidiSystem:
             return
         
         self.is_playing = True
-        self.start_time = time.time()
+        self._start_ns = time.monotonic_ns()
         
         print("🐕 Dog MIDI System started!")
         print("Let your dog play the keyboard - notes will be automatically corrected to sound musical!")
+        print("Listening for MIDI input... Press Ctrl+C to stop")
         
-        # Start input listening in a separate thread
-        input_thread = threading.Thread(target=self.listen_for_input)
-        input_thread.daemon = True
-        input_thread.start()
+        if self.midi_output:
+            self._scheduler_thread = threading.Thread(target=self._note_off_scheduler)
+            self._scheduler_thread.daemon = True
+            self._scheduler_thread.start()
         
         try:
             while self.is_playing:
@@ -294,7 +589,13 @@ class DogMidiSystem:
         self.is_playing = False
         if self.midi_input:
             self.midi_input.close()
+        if self._scheduler_thread:
+            self._noteoff_event.set()
+            self._scheduler_thread.join()
+            self._scheduler_thread = None
         if self.midi_output:
+            # Release anything still sounding before closing the port
+            self._send_note_offs(self._pop_due_note_offs(float('inf')))
             self.midi_output.close()
         pygame.midi.quit()
         print("\n🐕 Dog MIDI System stopped!")